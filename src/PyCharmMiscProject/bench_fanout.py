@@ -0,0 +1,110 @@
+import multiprocessing
+import os
+import selectors
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+# Benchmark configuration
+HOST = "127.0.0.1"
+PORT = 9400
+MEMBERS = 800
+MESSAGES = 200
+READERS = 4
+PAYLOAD = "x" * 100
+
+
+def connect(name):
+    # Log in and wait for the welcome so the server has the client registered
+    sock = socket.create_connection((HOST, PORT))
+    sock.sendall(name.encode())
+    data = b""
+    while b"Welcome" not in data:
+        data += sock.recv(4096)
+    return sock
+
+
+def drain(sock):
+    # Read and discard everything the server sends
+    try:
+        while sock.recv(65536):
+            pass
+    except OSError:
+        pass
+
+
+def reader(index, count, ready, go, results):
+    # Client process: hold count connections and time the delivery of every broadcast line
+    socks = [connect(f"r{index}_{i}") for i in range(count)]
+    sel = selectors.DefaultSelector()
+    for s in socks:
+        s.setblocking(False)
+        sel.register(s, selectors.EVENT_READ)
+
+    # Skip the join messages of the clients that logged in after us
+    ready.wait()
+    time.sleep(0.5)
+    for s in socks:
+        try:
+            while s.recv(65536):
+                pass
+        except BlockingIOError:
+            pass
+
+    go.wait()
+    lines = 0
+    expected = count * MESSAGES
+    while lines < expected:
+        for key, _ in sel.select(10):
+            lines += key.fileobj.recv(65536).count(b"\n")
+    results.put(time.perf_counter())
+
+
+def run(senders):
+    # Start a server with the given number of sender processes and measure deliveries/s
+    server = subprocess.Popen([sys.executable, "server.py", "--port", str(PORT), "--senders", str(senders)],
+                              stdout=subprocess.DEVNULL)
+    time.sleep(1.0)
+
+    ready = multiprocessing.Barrier(READERS + 1)
+    go = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    per_reader = MEMBERS // READERS
+    procs = [multiprocessing.Process(target=reader, args=(i, per_reader, ready, go, results))
+             for i in range(READERS)]
+    for p in procs:
+        p.start()
+
+    talker = connect("talker")
+    ready.wait()
+    time.sleep(1.0)
+    # Keep reading the talker's own echoes so it never backs up
+    threading.Thread(target=drain, args=(talker,), daemon=True).start()
+
+    start = time.perf_counter()
+    go.set()
+    talker.sendall(("".join(f"{PAYLOAD}\n" for _ in range(MESSAGES))).encode())
+    finished = max(results.get() for _ in procs)
+
+    for p in procs:
+        p.join()
+    talker.close()
+    server.terminate()
+    server.wait()
+    time.sleep(0.5)
+    return per_reader * READERS * MESSAGES / (finished - start)
+
+
+if __name__ == "__main__":
+    # Usage: python bench_fanout.py [max_senders]
+    # 0 senders is the old behaviour: every broadcast is sent from the client thread
+    top = int(sys.argv[1]) if len(sys.argv) > 1 else (os.cpu_count() or 1)
+    print(f"{MESSAGES} broadcasts to {MEMBERS} members, {os.cpu_count()} cores, "
+          f"clients in {READERS} separate processes")
+    base = None
+    for senders in range(0, top + 1):
+        rate = run(senders)
+        base = base or rate
+        print(f"{senders:>2} senders  {rate:10.0f} deliveries/s  x{rate / base:.2f}")
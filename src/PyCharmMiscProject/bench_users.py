@@ -0,0 +1,52 @@
+import socket
+import threading
+import time
+
+import server
+
+# Benchmark configuration
+MEMBERS = 10000
+REQUESTS = 2000
+
+
+def drain(sock):
+    # Read and discard everything the server sends
+    try:
+        while sock.recv(65536):
+            pass
+    except OSError:
+        pass
+
+
+def run(label, invalidate):
+    # Send /users REQUESTS times and report the server-side cost per request
+    sock, peer = socket.socketpair()
+    threading.Thread(target=drain, args=(peer,), daemon=True).start()
+
+    start = time.perf_counter()
+    for _ in range(REQUESTS):
+        if invalidate:
+            # Simulate a room that changes between every request
+            with server.lock:
+                server.invalidate_replies()
+        server.process_message(sock, "user0", "/users")
+    elapsed = time.perf_counter() - start
+
+    sock.close()
+    peer.close()
+    print(f"{label:<12} {elapsed / REQUESTS * 1e6:9.1f} us/request  "
+          f"{REQUESTS / elapsed:9.0f} requests/s")
+
+
+if __name__ == "__main__":
+    # Fill the room directly, the sockets are never written to by /users
+    placeholder, _ = socket.socketpair()
+    for i in range(MEMBERS):
+        name = f"user{i}"
+        server.clients[name] = placeholder
+        server.connection_order.append(name)
+    server.admin_username = "user0"
+
+    print(f"/users spam with {MEMBERS} members, {REQUESTS} requests")
+    run("rebuilt", invalidate=True)
+    run("cached", invalidate=False)
@@ -104,13 +104,24 @@ def perform_login():
             # Send nickname and check availability
             sock.sendall(name_prompt.encode())
             response = sock.recv(BUFFER).decode()
+            if not response:
+                # The server closed the connection, e.g. after waiting too long for a nickname
+                raise ConnectionError("Server closed the connection")
+            if response.startswith("BUSY"):
+                messagebox.showerror("Error", "Server is busy, try again later.")
+                sock.close()
+                root.destroy()
+                exit()
             if "TAKEN" in response:
                 retry = True
             else:
                 nickname = name_prompt
                 break
-        except:
-            break
+        except OSError:
+            messagebox.showerror("Error", "Lost connection to the server.")
+            sock.close()
+            root.destroy()
+            exit()
 
 
 perform_login()
@@ -0,0 +1,629 @@
+import argparse
+import random
+import re
+import selectors
+import socket
+import struct
+import time
+from datetime import datetime
+
+# Analyzer configuration
+CAPTURE = "../../wireshark/capture.pcap"
+HOST = "127.0.0.1"
+PORT = 9090
+BUFFER = 1024
+
+# Memory limits (keep the analyzer constant-memory on huge captures)
+MAX_PENDING = 64          # Out-of-order segments held per direction
+MAX_LINE = 64 * 1024      # Longest protocol line kept before it is cut
+IDLE_TIMEOUT = 300.0      # Seconds before a silent connection is dropped
+FANOUT_WINDOW = 1.0       # Seconds in which equal broadcast lines are grouped
+SAMPLES = 1024            # Reservoir size used for percentiles
+
+# Link layer types we can decode
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LOOP = 108
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_LINUX_SLL2 = 276
+
+# TCP flags
+FIN = 0x01
+SYN = 0x02
+RST = 0x04
+
+# Server lines that continue the previous reply instead of starting a new one
+CONTINUATION = ("- ", "Role: ")
+# Client commands in the order process_message checks them
+EXACT_COMMANDS = ("/quit", "/ping", "/uptime", "/users", "/admin", "/whoami")
+PREFIX_COMMANDS = ("/rename", "@", "/calc", "/mute", "/unmute")
+TIMESTAMPED = re.compile(r"^\[\d\d:\d\d:\d\d\] ")
+
+
+# ================= PCAP READING =================
+def read_pcap(path):
+    # Yield (timestamp, linktype, frame) for every record, one at a time
+    with open(path, "rb") as f:
+        header = f.read(24)
+        if len(header) < 24:
+            raise ValueError("File too short to be a pcap capture")
+
+        magic = header[:4]
+        if magic == b"\xd4\xc3\xb2\xa1":
+            endian, scale = "<", 1e-6
+        elif magic == b"\xa1\xb2\xc3\xd4":
+            endian, scale = ">", 1e-6
+        elif magic == b"\x4d\x3c\xb2\xa1":
+            endian, scale = "<", 1e-9
+        elif magic == b"\xa1\xb2\x3c\x4d":
+            endian, scale = ">", 1e-9
+        elif magic == b"\x0a\x0d\x0d\x0a":
+            raise ValueError("pcapng is not supported, save the capture as pcap")
+        else:
+            raise ValueError("Not a pcap file")
+
+        linktype = struct.unpack(endian + "I", header[20:24])[0] & 0x0FFFFFFF
+        record = struct.Struct(endian + "IIII")
+
+        while True:
+            raw = f.read(16)
+            if len(raw) < 16:
+                return
+            sec, frac, incl_len, _ = record.unpack(raw)
+            frame = f.read(incl_len)
+            if len(frame) < incl_len:
+                return
+            yield sec + frac * scale, linktype, frame
+
+
+def ip_payload(linktype, frame):
+    # Strip the link layer and return the IP packet (or None)
+    if linktype in (LINKTYPE_NULL, LINKTYPE_LOOP):
+        return frame[4:]
+    if linktype == LINKTYPE_RAW or linktype == 12:
+        return frame
+    if linktype == LINKTYPE_ETHERNET:
+        offset = 12
+        ethertype = struct.unpack("!H", frame[offset:offset + 2])[0]
+        # Skip VLAN tags
+        while ethertype in (0x8100, 0x88A8) and len(frame) >= offset + 6:
+            offset += 4
+            ethertype = struct.unpack("!H", frame[offset:offset + 2])[0]
+        if ethertype not in (0x0800, 0x86DD):
+            return None
+        return frame[offset + 2:]
+    if linktype == LINKTYPE_LINUX_SLL:
+        return frame[16:]
+    if linktype == LINKTYPE_LINUX_SLL2:
+        return frame[20:]
+    return None
+
+
+def parse_tcp(packet):
+    # Return (src, dst, seq, flags, payload) for a TCP packet, otherwise None
+    if not packet:
+        return None
+    version = packet[0] >> 4
+
+    if version == 4:
+        if len(packet) < 20:
+            return None
+        ihl = (packet[0] & 0x0F) * 4
+        total = struct.unpack("!H", packet[2:4])[0]
+        if packet[9] != 6:
+            return None
+        src_ip = socket.inet_ntop(socket.AF_INET, packet[12:16])
+        dst_ip = socket.inet_ntop(socket.AF_INET, packet[16:20])
+        # Ignore Ethernet padding past the IP total length
+        segment = packet[ihl:total] if total else packet[ihl:]
+    elif version == 6:
+        if len(packet) < 40 or packet[6] != 6:
+            return None
+        length = struct.unpack("!H", packet[4:6])[0]
+        src_ip = socket.inet_ntop(socket.AF_INET6, packet[8:24])
+        dst_ip = socket.inet_ntop(socket.AF_INET6, packet[24:40])
+        segment = packet[40:40 + length]
+    else:
+        return None
+
+    if len(segment) < 20:
+        return None
+    src_port, dst_port, seq = struct.unpack("!HHI", segment[:8])
+    data_offset = (segment[12] >> 4) * 4
+    flags = segment[13]
+    return (src_ip, src_port), (dst_ip, dst_port), seq, flags, segment[data_offset:]
+
+
+def tcp_segments(path):
+    # Yield decoded TCP segments from the capture
+    for ts, linktype, frame in read_pcap(path):
+        packet = ip_payload(linktype, frame)
+        parsed = parse_tcp(packet) if packet else None
+        if parsed:
+            yield (ts,) + parsed
+
+
+# ================= TCP REASSEMBLY =================
+class Direction:
+    # One side of a TCP connection, delivering bytes in sequence order
+    def __init__(self):
+        self.next_seq = None
+        self.pending = {}
+        self.segments = 0
+        self.bytes = 0
+        self.finished = False
+
+    def feed(self, seq, flags, payload):
+        # Return the in-order bytes released by this segment
+        if flags & SYN:
+            self.next_seq = (seq + 1) & 0xFFFFFFFF
+            seq = self.next_seq
+        if self.next_seq is None:
+            # Capture started mid-connection
+            self.next_seq = seq
+        if flags & (FIN | RST):
+            self.finished = True
+        if not payload:
+            return b""
+
+        self.segments += 1
+        offset = (self.next_seq - seq) & 0xFFFFFFFF
+        if offset < 0x80000000:
+            # Retransmission or overlap, keep only the new tail
+            if offset >= len(payload):
+                return b""
+            payload = payload[offset:]
+        else:
+            # Segment from the future, hold it until the gap is filled
+            if len(self.pending) < MAX_PENDING:
+                self.pending[seq] = payload
+                return b""
+            # Too many holes, give up on the missing bytes and resync
+            self.pending.clear()
+            self.next_seq = seq
+
+        out = [payload]
+        self.next_seq = (self.next_seq + len(payload)) & 0xFFFFFFFF
+        while self.next_seq in self.pending:
+            chunk = self.pending.pop(self.next_seq)
+            out.append(chunk)
+            self.next_seq = (self.next_seq + len(chunk)) & 0xFFFFFFFF
+
+        data = b"".join(out)
+        self.bytes += len(data)
+        return data
+
+
+class Connection:
+    # A chat session between one client and the server
+    def __init__(self, client, ts, mid_stream=False):
+        self.client = client
+        self.opened = ts
+        self.last_seen = ts
+        self.up = Direction()
+        self.down = Direction()
+        self.nickname = None
+        # A connection first seen without a SYN is already past the handshake
+        self.handshake_done = mid_stream
+        self.up_buffer = b""
+        self.down_buffer = b""
+        self.up_line_segments = 0
+        self.reply = None
+        self.reply_ts = None
+        self.waiting = []
+
+
+def chat_streams(path, port=PORT):
+    # Yield (ts, conn, direction, kind, data) events for every chat connection
+    # kind is "open", "data" or "close"; data events carry reassembled bytes
+    connections = {}
+    last_sweep = 0.0
+
+    for ts, src, dst, seq, flags, payload in tcp_segments(path):
+        if dst[1] == port:
+            key, upstream = (src, dst), True
+        elif src[1] == port:
+            key, upstream = (dst, src), False
+        else:
+            continue
+
+        conn = connections.get(key)
+        if conn is None:
+            # Late segments of a reset connection don't open a new one
+            if not (flags & SYN or upstream and payload):
+                continue
+            conn = Connection(key[0], ts, mid_stream=not flags & SYN)
+            connections[key] = conn
+            yield ts, conn, None, "open", b""
+        conn.last_seen = ts
+
+        side = conn.up if upstream else conn.down
+        data = side.feed(seq, flags, payload)
+        if data:
+            yield ts, conn, "up" if upstream else "down", "data", data
+
+        if flags & RST or (conn.up.finished and conn.down.finished):
+            del connections[key]
+            yield ts, conn, None, "close", b""
+
+        # Drop connections that went silent without a FIN
+        if ts - last_sweep > IDLE_TIMEOUT:
+            last_sweep = ts
+            for k, c in list(connections.items()):
+                if ts - c.last_seen > IDLE_TIMEOUT:
+                    del connections[k]
+                    yield ts, c, None, "close", b""
+
+    for conn in connections.values():
+        yield conn.last_seen, conn, None, "close", b""
+
+
+# ================= STATISTICS =================
+class Stats:
+    # Running min/avg/max with a fixed-size reservoir for percentiles
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.low = None
+        self.high = None
+        self.samples = []
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.low = value if self.low is None else min(self.low, value)
+        self.high = value if self.high is None else max(self.high, value)
+        if len(self.samples) < SAMPLES:
+            self.samples.append(value)
+        else:
+            i = random.randrange(self.count)
+            if i < SAMPLES:
+                self.samples[i] = value
+
+    def percentile(self, p):
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+    def summary(self, scale=1000.0, unit="ms"):
+        if not self.count:
+            return "n/a"
+        return (f"n={self.count} min={self.low * scale:.3f}{unit} "
+                f"avg={self.total / self.count * scale:.3f}{unit} "
+                f"p50={self.percentile(0.5) * scale:.3f}{unit} "
+                f"p99={self.percentile(0.99) * scale:.3f}{unit} "
+                f"max={self.high * scale:.3f}{unit}")
+
+
+def classify(line):
+    # Name the kind of a client line the same way process_message does
+    if line in EXACT_COMMANDS:
+        return line
+    for prefix in PREFIX_COMMANDS:
+        if line.startswith(prefix):
+            return "@pm" if prefix == "@" else prefix
+    return "message"
+
+
+def answers(kind, line, text, nickname):
+    # Whether a server reply is the answer to a pending request of this kind
+    body = text[11:] if TIMESTAMPED.match(text) else None
+    parts = line.split(maxsplit=1)
+    arg = parts[1].strip() if len(parts) == 2 else ""
+
+    if kind == "/ping":
+        return text == "Pong"
+    if kind == "/users":
+        return text.startswith("Connected users:")
+    if kind == "/calc":
+        return text.startswith("[CALC] ")
+    if kind == "/admin":
+        return text.startswith("Admin: ")
+    if kind == "/whoami":
+        return text.startswith("You are: ")
+    if kind == "/uptime":
+        return text.startswith("[SERVER] Server Uptime: ")
+    if kind == "/quit":
+        return text == "[SERVER] You disconnected."
+    if kind in ("/mute", "/unmute"):
+        verb = "muted" if kind == "/mute" else "unmuted"
+        return text == "[ERROR] Admin only." or body == f"{arg} has been {verb}."
+    if kind == "/rename":
+        if text.startswith("[ERROR] The name "):
+            return True
+        if body is None or not body.endswith(f" changed name to {arg}."):
+            return False
+        return nickname is None or body.startswith(f"{nickname} changed name to ")
+    if kind == "@pm":
+        if text.startswith(("[ERROR] User '", "[ERROR] Usage: @")):
+            return True
+        return body is not None and (body.startswith("[PM to ")
+                                     or nickname is not None and body.startswith(f"[PM from {nickname}] "))
+    # A chat message is answered by its own broadcast echo
+    if text == "[SYSTEM] You are muted.":
+        return True
+    if body is None:
+        return False
+    if nickname is None:
+        return body.endswith(f": {line}")
+    return body == f"{nickname}: {line}"
+
+
+# ================= ANALYSIS =================
+def analyze(path, port=PORT, verbose=False):
+    # Walk the capture once and collect protocol statistics
+    report = {
+        "connections": 0,
+        "handshakes": 0,
+        "taken": 0,
+        "commands": {},
+        "latency": {},
+        "handshake": Stats(),
+        "fanout": Stats(),
+        "fanout_size": Stats(),
+        "broadcasts": 0,
+        "up_segments": 0,
+        "down_segments": 0,
+        "up_bytes": 0,
+        "down_bytes": 0,
+        "split_lines": 0,
+        "segments_per_line": Stats(),
+    }
+    fanout = {}
+
+    def flush_fanout(ts):
+        # Close broadcast groups that are older than the grouping window
+        # Groups sit in first-seen order (updates keep their place), so stop at the first open one
+        while fanout:
+            text = next(iter(fanout))
+            first, last, count = fanout[text]
+            if ts - first <= FANOUT_WINDOW:
+                return
+            del fanout[text]
+            report["broadcasts"] += 1
+            report["fanout"].add(last - first)
+            report["fanout_size"].add(count)
+
+    def client_line(ts, conn, line):
+        if not conn.handshake_done:
+            return
+        kind = classify(line)
+        report["commands"][kind] = report["commands"].get(kind, 0) + 1
+        report["segments_per_line"].add(conn.up_line_segments)
+        if conn.up_line_segments > 1:
+            report["split_lines"] += 1
+        conn.waiting.append((ts, kind, line))
+        if len(conn.waiting) > MAX_PENDING:
+            conn.waiting.pop(0)
+        if verbose:
+            print(f"{fmt(ts)} {conn.nickname} -> {line}")
+
+    def server_reply(ts, conn, text):
+        # Match the reply to the oldest pending request it answers
+        # Broadcasts caused by other users match nothing and pop nothing
+        for i, (sent, kind, line) in enumerate(conn.waiting):
+            if answers(kind, line, text, conn.nickname):
+                del conn.waiting[i]
+                report["latency"].setdefault(kind, Stats()).add(ts - sent)
+                # Follow renames, and learn the nickname of mid-stream connections
+                body = text[11:]
+                if kind == "/rename" and not text.startswith("[ERROR]"):
+                    conn.nickname = line.split(maxsplit=1)[1].strip()
+                elif kind == "message" and conn.nickname is None and body.endswith(f": {line}"):
+                    conn.nickname = body[:-len(line) - 2]
+                break
+        if TIMESTAMPED.match(text):
+            body = text[11:]
+            first, last, count = fanout.get(body, (ts, ts, 0))
+            fanout[body] = (first, ts, count + 1)
+        if verbose:
+            print(f"{fmt(ts)} {conn.nickname} <- {text!r}")
+
+    for ts, conn, direction, kind, data in chat_streams(path, port):
+        flush_fanout(ts)
+
+        if kind == "open":
+            report["connections"] += 1
+            continue
+
+        if kind == "close":
+            report["up_segments"] += conn.up.segments
+            report["down_segments"] += conn.down.segments
+            report["up_bytes"] += conn.up.bytes
+            report["down_bytes"] += conn.down.bytes
+            if verbose:
+                print(f"{fmt(ts)} {conn.nickname or conn.client} closed")
+            continue
+
+        if direction == "up":
+            conn.up_buffer += data
+            conn.up_line_segments += 1
+            if not conn.handshake_done:
+                # The nickname is sent on its own, without a newline
+                conn.nickname = conn.up_buffer.decode(errors="replace").strip()
+                conn.up_buffer = b""
+                conn.up_line_segments = 0
+                conn.waiting.append((ts, "handshake", ""))
+                if len(conn.waiting) > MAX_PENDING:
+                    conn.waiting.pop(0)
+                continue
+            if b"\n" in conn.up_buffer:
+                *lines, conn.up_buffer = conn.up_buffer.split(b"\n")
+                for line in lines:
+                    text = line.decode(errors="replace").strip()
+                    if text:
+                        client_line(ts, conn, text)
+                    # Later lines in this batch arrived in the current segment
+                    conn.up_line_segments = 1
+                conn.up_line_segments = 1 if conn.up_buffer else 0
+            if len(conn.up_buffer) > MAX_LINE:
+                conn.up_buffer = b""
+            continue
+
+        conn.down_buffer += data
+        if not conn.handshake_done:
+            for answer in (b"OK", b"TAKEN"):
+                if conn.down_buffer.startswith(answer):
+                    conn.down_buffer = conn.down_buffer[len(answer):]
+                    if conn.waiting:
+                        report["handshake"].add(ts - conn.waiting.pop(0)[0])
+                    if answer == b"OK":
+                        conn.handshake_done = True
+                        report["handshakes"] += 1
+                    else:
+                        report["taken"] += 1
+                    break
+            else:
+                if len(conn.down_buffer) > MAX_LINE:
+                    conn.down_buffer = b""
+                continue
+
+        if b"\n" in conn.down_buffer:
+            *lines, conn.down_buffer = conn.down_buffer.split(b"\n")
+            for line in lines:
+                text = line.decode(errors="replace")
+                if conn.reply is not None and text.startswith(CONTINUATION):
+                    conn.reply += "\n" + text
+                    continue
+                if conn.reply is not None:
+                    server_reply(conn.reply_ts, conn, conn.reply)
+                conn.reply, conn.reply_ts = text, ts
+        if conn.reply is not None and not conn.down_buffer:
+            # Segment ended on a line boundary, the reply is complete
+            server_reply(conn.reply_ts, conn, conn.reply)
+            conn.reply = None
+        if len(conn.down_buffer) > MAX_LINE:
+            conn.down_buffer = b""
+
+    flush_fanout(float("inf"))
+    return report
+
+
+def fmt(ts):
+    return datetime.fromtimestamp(ts).strftime("%H:%M:%S.%f")
+
+
+def print_report(report):
+    print(f"Connections:        {report['connections']}")
+    print(f"Handshakes:         {report['handshakes']} ok, {report['taken']} taken")
+    print(f"Handshake latency:  {report['handshake'].summary()}")
+    print()
+    print("Commands:")
+    for kind, count in sorted(report["commands"].items(), key=lambda x: -x[1]):
+        print(f"  {kind:<10} {count}")
+    print()
+    print("Response latency:")
+    for kind, stats in sorted(report["latency"].items()):
+        print(f"  {kind:<10} {stats.summary()}")
+    print()
+    print(f"Broadcasts:         {report['broadcasts']}")
+    print(f"Fan-out spread:     {report['fanout'].summary()}")
+    print(f"Fan-out recipients: {report['fanout_size'].summary(1, '')}")
+    print()
+    print(f"Client->server:     {report['up_segments']} segments, {report['up_bytes']} bytes")
+    print(f"Server->client:     {report['down_segments']} segments, {report['down_bytes']} bytes")
+    print(f"Segments per line:  {report['segments_per_line'].summary(1, '')}")
+    print(f"Lines split:        {report['split_lines']}")
+
+
+# ================= REPLAY =================
+def replay(path, host=HOST, port=PORT, speedup=1.0, capture_port=PORT):
+    # Re-send every recorded client stream to a live server with the original timing
+    sel = selectors.DefaultSelector()
+    sockets = {}
+    received = 0
+    sent = 0
+    failed = 0
+    start_wall = None
+    start_ts = None
+
+    def end(key):
+        # Forget one replayed connection; the others keep going
+        s = sockets.pop(key, None)
+        if s:
+            try:
+                sel.unregister(s)
+            except (KeyError, ValueError):
+                pass
+            s.close()
+
+    def drain(timeout):
+        # Read and discard server output until the timeout passes
+        nonlocal received
+        deadline = time.monotonic() + max(0.0, timeout)
+        while True:
+            remaining = deadline - time.monotonic()
+            for key, _ in sel.select(max(0.0, remaining) if sel.get_map() else 0):
+                try:
+                    data = key.fileobj.recv(BUFFER)
+                except OSError:
+                    data = b""
+                if data:
+                    received += len(data)
+                else:
+                    sel.unregister(key.fileobj)
+            if not sel.get_map():
+                time.sleep(max(0.0, remaining))
+            if remaining <= 0:
+                return
+
+    for ts, conn, direction, kind, data in chat_streams(path, capture_port):
+        if start_ts is None:
+            start_ts, start_wall = ts, time.monotonic()
+        drain(start_wall + (ts - start_ts) / speedup - time.monotonic())
+
+        if kind == "open":
+            try:
+                s = socket.create_connection((host, port))
+            except OSError as e:
+                print(f"{fmt(ts)} connect failed: {e}")
+                failed += 1
+                continue
+            sockets[id(conn)] = s
+            sel.register(s, selectors.EVENT_READ)
+        elif kind == "data" and direction == "up":
+            s = sockets.get(id(conn))
+            if s:
+                try:
+                    s.sendall(data)
+                    sent += len(data)
+                except OSError as e:
+                    # The server closed this session (e.g. handshake timeout), only it ends
+                    print(f"{fmt(ts)} {conn.client[0]}:{conn.client[1]} closed by server: {e}")
+                    failed += 1
+                    end(id(conn))
+        elif kind == "close":
+            end(id(conn))
+
+    # Give the server a moment to answer the last requests
+    drain(0.5)
+    for s in sockets.values():
+        s.close()
+    print(f"Replay finished: {sent} bytes sent, {received} bytes received, {failed} connections failed")
+
+
+def positive_float(text):
+    # argparse type for --speedup, which divides the capture timing
+    value = float(text)
+    if value <= 0:
+        raise argparse.ArgumentTypeError("must be greater than 0")
+    return value
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyze or replay chat captures")
+    parser.add_argument("mode", choices=["analyze", "replay"])
+    parser.add_argument("pcap", nargs="?", default=CAPTURE)
+    parser.add_argument("--port", type=int, default=PORT, help="chat port inside the capture")
+    parser.add_argument("--host", default=HOST, help="server to replay against")
+    parser.add_argument("--target-port", type=int, default=PORT, help="port to replay against")
+    parser.add_argument("--speedup", type=positive_float, default=1.0, help="replay speed multiplier")
+    parser.add_argument("-v", "--verbose", action="store_true", help="print every decoded message")
+    args = parser.parse_args()
+
+    if args.mode == "analyze":
+        print_report(analyze(args.pcap, args.port, args.verbose))
+    else:
+        replay(args.pcap, args.host, args.target_port, args.speedup, args.port)
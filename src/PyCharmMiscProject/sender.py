@@ -0,0 +1,167 @@
+import os
+import selectors
+import socket
+import struct
+import sys
+import time
+
+# Frames sent by the server to a sender process: (op, client id, payload length) + payload
+FRAME = struct.Struct("!BQI")
+OP_ADD = 1          # Start owning the socket passed along with the frame
+OP_REMOVE = 2       # Flush what is queued for the client, then close it
+OP_SEND = 3         # Queue data for one client
+OP_BROADCAST = 4    # Queue data for every client of this process
+OP_FLUSH = 5        # Report back once nothing is left to send
+
+# Reports sent back to the server: (op, client id)
+REPORT = struct.Struct("!BQ")
+OP_DEAD = 6         # Sending to the client failed, the socket was closed
+OP_FLUSHED = 7      # Answer to OP_FLUSH
+
+# Sender configuration
+BUFFER = 64 * 1024
+MAX_FDS = 64
+MAX_OUTBOUND = 1024 * 1024   # Bytes queued for one client before it is dropped
+EXIT_FLUSH_TIMEOUT = 5.0     # Time to finish sending after the server went away
+CLOSE_FLUSH_TIMEOUT = 5.0    # Time a removed client gets to take its queued output
+
+
+def run(fd):
+    # Event loop of a sender process: write everything the server queues to the sockets it owns
+    channel = socket.socket(fileno=fd)
+    sel = selectors.DefaultSelector()
+    sel.register(channel, selectors.EVENT_READ)
+
+    socks = {}        # client id -> socket
+    pending = {}      # client id -> bytes the kernel did not take yet
+    closing = {}      # client id -> deadline to close by, oldest first
+    flushes = []      # OP_FLUSH requests waiting for pending to empty
+    inbuf = bytearray()
+    fds = []
+
+    def report(op, cid):
+        try:
+            channel.sendall(REPORT.pack(op, cid))
+        except OSError:
+            pass
+
+    def close(cid, dead):
+        s = socks.pop(cid, None)
+        if s is None:
+            return
+        if pending.pop(cid, None) is not None:
+            sel.unregister(s)
+        closing.pop(cid, None)
+        s.close()
+        if dead:
+            report(OP_DEAD, cid)
+
+    def write(cid, data):
+        s = socks.get(cid)
+        if s is None:
+            return
+        if cid in pending:
+            # Keep the order: queue behind what is already waiting
+            pending[cid] += data
+            if len(pending[cid]) > MAX_OUTBOUND:
+                close(cid, dead=True)
+            return
+        try:
+            # Never block, the socket is shared with the server's blocking reader
+            sent = s.send(data, socket.MSG_DONTWAIT)
+        except BlockingIOError:
+            sent = 0
+        except OSError:
+            close(cid, dead=True)
+            return
+        if sent < len(data):
+            pending[cid] = bytearray(data[sent:])
+            sel.register(s, selectors.EVENT_WRITE, cid)
+
+    def resume(cid):
+        # The socket can take more data, continue the queued output
+        if cid not in pending:
+            return   # Closed earlier in the same batch of events
+        s = socks[cid]
+        try:
+            sent = s.send(pending[cid], socket.MSG_DONTWAIT)
+        except BlockingIOError:
+            return
+        except OSError:
+            close(cid, dead=True)
+            return
+        del pending[cid][:sent]
+        if not pending[cid]:
+            del pending[cid]
+            sel.unregister(s)
+            if cid in closing:
+                close(cid, dead=False)
+
+    def handle(op, cid, data):
+        if op == OP_ADD:
+            socks[cid] = socket.socket(fileno=fds.pop(0))
+        elif op == OP_REMOVE:
+            if cid in pending:
+                closing[cid] = time.time() + CLOSE_FLUSH_TIMEOUT
+            else:
+                close(cid, dead=False)
+        elif op == OP_SEND:
+            write(cid, data)
+        elif op == OP_BROADCAST:
+            for member in list(socks):
+                if member not in closing:
+                    write(member, data)
+        elif op == OP_FLUSH:
+            flushes.append(cid)
+
+    while True:
+        # Wake up for the oldest close deadline; deadlines are added in order
+        timeout = None
+        if closing:
+            timeout = max(0.0, next(iter(closing.values())) - time.time())
+        for key, _ in sel.select(timeout):
+            if key.fileobj is not channel:
+                resume(key.data)
+                continue
+
+            try:
+                data, received, _, _ = socket.recv_fds(channel, BUFFER, MAX_FDS)
+            except OSError:
+                data, received = b"", []
+            if not data:
+                # The server is gone, finish what is queued and leave
+                deadline = time.time() + EXIT_FLUSH_TIMEOUT
+                sel.unregister(channel)
+                while pending and time.time() < deadline:
+                    for k, _ in sel.select(deadline - time.time()):
+                        resume(k.data)
+                os._exit(0)
+
+            inbuf += data
+            fds.extend(received)
+            offset = 0
+            while len(inbuf) - offset >= FRAME.size:
+                op, cid, length = FRAME.unpack_from(inbuf, offset)
+                end = offset + FRAME.size + length
+                if end > len(inbuf):
+                    break
+                handle(op, cid, bytes(inbuf[offset + FRAME.size:end]))
+                offset = end
+            del inbuf[:offset]
+
+        # A reader that stopped reading does not keep its socket and queue forever
+        while closing:
+            cid, deadline = next(iter(closing.items()))
+            if deadline > time.time():
+                break
+            close(cid, dead=False)
+
+        if flushes and not pending:
+            for token in flushes:
+                report(OP_FLUSHED, token)
+            flushes.clear()
+
+
+if __name__ == "__main__":
+    # Started by server.py as "python sender.py FD"
+    run(int(sys.argv[1]))
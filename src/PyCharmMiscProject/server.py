@@ -1,13 +1,46 @@
+import argparse
+import errno
+import itertools
+import json
+import os
+import queue
+import select
 import socket
+import struct
+import subprocess
+import sys
 import threading
 import time
 from datetime import datetime
 
+import sender
+
 # Server configuration
 HOST = "127.0.0.1"
 PORT = 9090
 BUFFER = 1024
 
+# Graceful reload configuration
+HANDOFF_PATH = "/tmp/chat_server_handoff_{port}.sock"
+HANDOFF_HELLO = b"CHAT-HANDOFF 2\n"
+HANDOFF_HELLO_TIMEOUT = 2.0
+HANDOFF_DRAIN_TIMEOUT = 5.0
+HANDOFF_EXCHANGE_TIMEOUT = 5.0   # State, descriptors and acknowledgement, after the drain
+MAX_FDS_PER_MESSAGE = 200
+
+# Fan-out configuration (0 sender processes sends from the client threads)
+SENDER_PROCESSES = os.cpu_count() or 1
+SENDER_FLUSH_TIMEOUT = 5.0
+
+# Admission control configuration (caps can be set with CHAT_MAX_* or --max-*)
+LISTEN_BACKLOG = 1024
+MAX_CONNECTIONS = int(os.environ.get("CHAT_MAX_CONNECTIONS", 10000))
+MAX_HANDSHAKES = int(os.environ.get("CHAT_MAX_HANDSHAKES", 256))
+ACCEPT_BACKOFF_ERRORS = (errno.EMFILE, errno.ENFILE, errno.ENOBUFS, errno.ENOMEM)
+HANDSHAKE_TIMEOUT = 120.0   # Per nickname attempt; the GUI connects before asking, a person is typing
+ACCEPT_BATCH = 64
+BUSY_REPLY = "BUSY [SERVER] Server is busy, try again later.\n"
+
 # Global state management
 clients = {}
 connection_order = []
@@ -18,35 +51,209 @@ server_start_time = time.time()
 # Lock for thread safety
 lock = threading.Lock()
 
+# fd passing needs Unix sockets, reload and sender processes are unavailable elsewhere
+FD_PASSING = hasattr(socket, "AF_UNIX") and hasattr(socket, "send_fds")
+RELOAD_SUPPORTED = FD_PASSING and hasattr(select, "poll")
+
+# Handoff state: sockets served by a thread, and those parked for a new process
+listener = None
+active = set()
+handshaking = set()
+parked = {}
+handoff_requested = threading.Event()
+handoff_finished = threading.Event()
+accept_paused = threading.Event()
+# Written once when a handoff starts to wake every waiting thread
+wake_r, wake_w = os.pipe() if RELOAD_SUPPORTED else (None, None)
+
+# Cached replies, rebuilt only when the room changes
+now_cache = (0, "")
+replies_generation = 0
+users_reply = None
+admin_reply = None
+whoami_replies = {}
+
+# Sender shards: each logged-in socket is written only by the process that owns it
+shards = []
+routes = {}     # socket -> (shard, client id)
+routed = {}     # (shard, client id) -> (socket, username), to act on sender reports
+route_ids = itertools.count(1)
+reports = queue.Queue()
+
 
 def now():
-    # Return current time as a string
-    return datetime.now().strftime("%H:%M:%S")
+    # Return current time as a string, formatted at most once per second
+    global now_cache
+    second = int(time.time())
+    cached_second, text = now_cache
+    if second != cached_second:
+        text = datetime.fromtimestamp(second).strftime("%H:%M:%S")
+        now_cache = (second, text)
+    return text
 
 
 def safe_send(sock, msg):
-    # Try to send a message to a socket
+    # Try to send a message (str or pre-encoded bytes) to a socket
+    data = msg if isinstance(msg, bytes) else msg.encode()
+    # Sockets owned by a sender shard are written there, keeping their order
+    route = routes.get(sock)
+    if route:
+        shard, cid = route
+        return shard.send(sender.OP_SEND, cid, data)
     try:
-        sock.sendall(msg.encode())
+        sock.sendall(data)
         return True
     except:
         return False
 
 
-# --- Critical fix logic ---
+def invalidate_replies():
+    # Drop cached presence replies after a join, leave, rename or admin change
+    # Callers hold the lock; bumping the generation stops an in-progress rebuild from storing a stale reply
+    global users_reply, admin_reply, whoami_replies, replies_generation
+    replies_generation += 1
+    users_reply = None
+    admin_reply = None
+    whoami_replies = {}
+
+
+# --- Sharded fan-out ---
+class SenderShard:
+    # Server side of one sender process (see sender.py)
+    def __init__(self, channel, process):
+        self.channel = channel
+        self.process = process
+        self.lock = threading.Lock()
+        self.members = set()
+        self.flushed = threading.Event()
+
+    def send(self, op, cid, data=b"", fd=None):
+        # Write one frame; frames from different threads never interleave
+        frame = sender.FRAME.pack(op, cid, len(data)) + data
+        try:
+            with self.lock:
+                if fd is None:
+                    self.channel.sendall(frame)
+                else:
+                    socket.send_fds(self.channel, [frame], [fd])
+            return True
+        except OSError:
+            return False
+
+
+def start_senders(count=None):
+    # Start the sender processes, or send from the client threads without fd passing
+    global shards
+    if count is None:
+        count = SENDER_PROCESSES
+    shards = []
+    if not FD_PASSING:
+        return
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sender.py")
+    threading.Thread(target=drop_routes, daemon=True).start()
+    for _ in range(count):
+        parent, child = socket.socketpair()
+        process = subprocess.Popen([sys.executable, script, str(child.fileno())], pass_fds=(child.fileno(),))
+        child.close()
+        shard = SenderShard(parent, process)
+        threading.Thread(target=read_reports, args=(shard,), daemon=True).start()
+        shards.append(shard)
+
+
+def read_reports(shard):
+    # Pass reports from a sender process to drop_routes; never takes the global lock itself
+    buffer = b""
+    while True:
+        try:
+            data = shard.channel.recv(BUFFER)
+        except OSError:
+            data = b""
+        if not data:
+            # The sender process is gone, a client id of None drops the whole shard
+            reports.put((shard, None))
+            return
+        buffer += data
+        while len(buffer) >= sender.REPORT.size:
+            op, cid = sender.REPORT.unpack_from(buffer)
+            buffer = buffer[sender.REPORT.size:]
+            if op == sender.OP_DEAD:
+                reports.put((shard, cid))
+            elif op == sender.OP_FLUSHED:
+                shard.flushed.set()
+
+
+def attach(sock, username):
+    # Hand a logged-in socket to the least loaded shard (caller holds the lock)
+    if not shards:
+        return
+    shard = min(shards, key=lambda sh: len(sh.members))
+    cid = next(route_ids)
+    if shard.send(sender.OP_ADD, cid, fd=sock.fileno()):
+        shard.members.add(cid)
+        routes[sock] = (shard, cid)
+        routed[(shard, cid)] = (sock, username)
+
+
+def detach(sock):
+    # Stop routing a socket; its shard closes its copy once queued data is sent
+    route = routes.pop(sock, None)
+    if route:
+        shard, cid = route
+        shard.members.discard(cid)
+        routed.pop(route, None)
+        shard.send(sender.OP_REMOVE, cid)
+
+
+def drop_routes():
+    # Single worker disconnecting clients their sender process could not write to
+    global shards
+    while True:
+        shard, cid = reports.get()
+        with lock:
+            if cid is None:
+                # Without its process nothing routed to this shard can be sent; new clients go elsewhere
+                shards = [sh for sh in shards if sh is not shard]
+                dropped = [routed[(shard, c)] for c in shard.members]
+            else:
+                dropped = [routed[(shard, cid)]] if (shard, cid) in routed else []
+        if cid is None:
+            # The channel is left to the garbage collector so its fd is not reused under a late send
+            shard.process.poll()
+            print(f"Sender process exited, dropping its {len(dropped)} clients")
+
+        # Shut every socket down first: a cleanup below may close another one a thread still polls
+        for sk, _ in dropped:
+            try:
+                # Wakes the client thread blocked waiting for input
+                sk.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        for sk, username in dropped:
+            cleanup_user(username, sk)
+
+
+def flush_senders(timeout):
+    # Wait until every shard has written out everything queued so far
+    current = shards
+    for shard in current:
+        shard.flushed.clear()
+        shard.send(sender.OP_FLUSH, 0)
+    deadline = time.time() + timeout
+    return all(shard.flushed.wait(max(0.0, deadline - time.time())) for shard in current)
+
+
 def broadcast(msg):
-    # Copy client list safely while holding the lock
-    # Prevents server crash if a user disconnects suddenly
+    # Encode once and hand the same buffer to every shard
+    data = msg.encode()
+    if shards:
+        for shard in shards:
+            shard.send(sender.OP_BROADCAST, 0, data)
+        return
+
+    # Without sender processes, send from this thread like before
     with lock:
         active_clients = list(clients.items())
-
-    dead = []
-    # Iterate over copied list to send messages
-    for u, s in active_clients:
-        if not safe_send(s, msg):
-            dead.append(u)
-
-    # Clean up disconnected users
+    dead = [u for u, sk in active_clients if not safe_send(sk, data)]
     for u in dead:
         cleanup_user(u)
 
@@ -56,25 +263,30 @@ def broadcast(msg):
 def promote_new_admin():
     global admin_username
     # Check if there are other users to promote
-    if connection_order:
-        admin_username = connection_order[0]
+    with lock:
+        admin_username = connection_order[0] if connection_order else None
+        invalidate_replies()
+
+    if admin_username:
         # Verify user existence before sending
         if admin_username in clients:
             safe_send(clients[admin_username], f"[{now()}] You are now the administrator.\n")
         broadcast(f"[{now()}] {admin_username} is now the administrator.\n")
-    else:
-        admin_username = None
 
 
-def cleanup_user(username):
+def cleanup_user(username, expected=None):
     global admin_username
 
     # Use lock to prevent race conditions during deletion
     with lock:
         if username not in clients: return
+        # The name may belong to someone else by now if the user renamed
+        if expected is not None and clients[username] is not expected: return
         sock = clients.pop(username, None)
         if username in muted_users: muted_users.pop(username, None)
         if username in connection_order: connection_order.remove(username)
+        detach(sock)
+        invalidate_replies()
 
     # Close the socket if it exists
     if sock:
@@ -89,7 +301,7 @@ def cleanup_user(username):
 
 
 def process_message(sock, current_username, msg):
-    global admin_username
+    global admin_username, users_reply, admin_reply
 
     # Handle quit command
     if msg == "/quit":
@@ -111,22 +323,41 @@ def process_message(sock, current_username, msg):
 
     # Handle users list command
     if msg == "/users":
-        with lock:  # Lock briefly to read the list
-            users = list(clients.keys())
-            admin = admin_username
-        text = "\n".join(f"- {u}" + (" (Admin)" if u == admin else "") for u in users)
-        safe_send(sock, f"Connected users:\n{text}\n")
+        with lock:  # Lock briefly to read the cached reply or copy the list
+            reply = users_reply
+            if reply is None:
+                generation = replies_generation
+                users = list(clients)
+                admin = admin_username
+
+        if reply is None:
+            # Build the text outside the lock, keep it only if the room didn't change meanwhile
+            text = "\n".join(f"- {u}" + (" (Admin)" if u == admin else "") for u in users)
+            reply = f"Connected users:\n{text}\n".encode()
+            with lock:
+                if replies_generation == generation:
+                    users_reply = reply
+        safe_send(sock, reply)
         return current_username
 
     # Handle admin status command
     if msg == "/admin":
-        safe_send(sock, f"Admin: {admin_username}\n")
+        with lock:
+            reply = admin_reply
+            if reply is None:
+                reply = admin_reply = f"Admin: {admin_username}\n".encode()
+        safe_send(sock, reply)
         return current_username
 
     # Handle whoami command
     if msg == "/whoami":
-        role = "Administrator" if current_username == admin_username else "Regular user"
-        safe_send(sock, f"You are: {current_username}\nRole: {role}\n")
+        with lock:
+            reply = whoami_replies.get(current_username)
+            if reply is None:
+                role = "Administrator" if current_username == admin_username else "Regular user"
+                reply = f"You are: {current_username}\nRole: {role}\n".encode()
+                whoami_replies[current_username] = reply
+        safe_send(sock, reply)
         return current_username
 
     # Handle rename command
@@ -142,10 +373,13 @@ def process_message(sock, current_username, msg):
 
             # Update client dictionary and lists
             clients[new_name] = clients.pop(current_username)
+            if sock in routes:
+                routed[routes[sock]] = (sock, new_name)
             if current_username in connection_order:
                 connection_order[connection_order.index(current_username)] = new_name
             if current_username == admin_username:
                 admin_username = new_name
+            invalidate_replies()
 
             old_name = current_username
             current_username = new_name
@@ -228,14 +462,60 @@ def process_message(sock, current_username, msg):
     return current_username
 
 
-def handle_client(sock):
+def make_poller(sock):
+    # Poll the socket together with the handoff wake-up pipe
+    if not RELOAD_SUPPORTED:
+        return None
+    poller = select.poll()
+    poller.register(sock, select.POLLIN)
+    poller.register(wake_r, select.POLLIN)
+    return poller
+
+
+def wait_readable(sock, poller, username, buffer, deadline=None):
+    # Block until the socket has data, parking it while a handoff runs
+    # Returns False if the deadline passes first
+    while True:
+        if handoff_requested.is_set():
+            with lock:
+                parked[sock] = (username, buffer)
+            # On success the old process exits while parked, otherwise keep serving
+            handoff_finished.wait()
+            with lock:
+                parked.pop(sock, None)
+            continue
+
+        timeout = None
+        if deadline is not None:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                return False
+        if poller is None:
+            # Without reload support the socket is all we wait for
+            if select.select([sock], [], [], timeout)[0]:
+                return True
+            continue
+        # Only the wake-up pipe firing means a handoff started
+        for fd, _ in poller.poll(None if timeout is None else timeout * 1000):
+            if fd != wake_r:
+                return True
+
+
+def handle_client(sock, username=None, buffer=""):
     global admin_username
-    username = None
-    buffer = ""
+    # Sockets inherited from a previous process are already logged in
+    inherited = username is not None
+    poller = make_poller(sock)
+
+    with lock:
+        active.add(sock)
 
     try:
-        while True:
+        while not inherited:
+            # Clients that never send a nickname are dropped after HANDSHAKE_TIMEOUT, restarted after TAKEN
+            deadline = time.time() + HANDSHAKE_TIMEOUT
             # Receive initial data
+            if not wait_readable(sock, poller, None, "", deadline): return
             data = sock.recv(BUFFER)
             if not data: return
             temp_name = data.decode().strip()
@@ -249,20 +529,26 @@ def handle_client(sock):
                     username = temp_name
                     clients[username] = sock
                     connection_order.append(username)
+                    attach(sock, username)
+                    handshaking.discard(sock)
+                    invalidate_replies()
                     # Break loop if successful
                     break
 
-        # Assign admin role if needed
-        with lock:
-            if admin_username is None:
-                admin_username = username
-                safe_send(sock, f"[{now()}] You are the administrator.\n")
+        if not inherited:
+            # Assign admin role if needed
+            with lock:
+                if admin_username is None:
+                    admin_username = username
+                    invalidate_replies()
+                    safe_send(sock, f"[{now()}] You are the administrator.\n")
 
-        safe_send(sock, f"[{now()}] Welcome {username}!\n")
-        broadcast(f"[{now()}] {username} joined the chat.\n")
+            safe_send(sock, f"[{now()}] Welcome {username}!\n")
+            broadcast(f"[{now()}] {username} joined the chat.\n")
 
         # Main message loop
         while True:
+            wait_readable(sock, poller, username, buffer)
             data = sock.recv(BUFFER)
             if not data: break
             buffer += data.decode()
@@ -277,6 +563,9 @@ def handle_client(sock):
     except:
         pass
     finally:
+        with lock:
+            active.discard(sock)
+            handshaking.discard(sock)
         # Cleanup logic on exit
         if username:
             cleanup_user(username)
@@ -289,19 +578,288 @@ def handle_client(sock):
                 pass
 
 
-def start_server():
-    # Initialize server socket
-    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    # Allow immediate port reuse after stop
-    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    s.bind((HOST, PORT))
-    s.listen()
+# --- Graceful reload ---
+def recv_exact(sock, size):
+    # Read exactly size bytes from a stream socket
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk: raise ConnectionError("Handoff peer closed")
+        data += chunk
+    return data
+
+
+def set_deadline(sock, deadline):
+    # Limit the next socket operation to the time left before deadline
+    left = deadline - time.time()
+    if left <= 0: raise TimeoutError("Handoff timed out")
+    sock.settimeout(left)
+
+
+def hand_off(conn):
+    # Pass the listening socket, live clients and room state to a new process
+    handoff_finished.clear()
+    accept_paused.clear()
+    handoff_requested.set()
+    os.write(wake_w, b"x")
+
+    try:
+        # Stop accepting, then wait for every client thread to finish its current message and park
+        deadline = time.time() + HANDOFF_DRAIN_TIMEOUT
+        while time.time() < deadline:
+            with lock:
+                if accept_paused.is_set() and active.issubset(parked): break
+            time.sleep(0.05)
+        if not accept_paused.is_set():
+            raise TimeoutError("Accept loop did not pause")
+        # Everything queued on the sender processes must reach the clients first
+        if not flush_senders(SENDER_FLUSH_TIMEOUT):
+            raise TimeoutError("Sender processes did not flush")
+
+        with lock:
+            socks = [sk for sk in parked if sk.fileno() >= 0]
+            names = [parked[sk][0] for sk in socks]
+            state = {
+                "server_start_time": server_start_time,
+                "admin_username": admin_username,
+                "muted_users": [u for u in muted_users if u in names],
+                "connection_order": [u for u in connection_order if u in names],
+                "clients": [parked[sk] for sk in socks],
+            }
+            fds = [listener.fileno()] + [sk.fileno() for sk in socks]
+        state["fds"] = len(fds)
+
+        # State goes first, then the descriptors in batches; a stalled peer must not freeze the room
+        deadline = time.time() + HANDOFF_EXCHANGE_TIMEOUT
+        payload = json.dumps(state).encode()
+        set_deadline(conn, deadline)
+        conn.sendall(struct.pack("!I", len(payload)) + payload)
+        for i in range(0, len(fds), MAX_FDS_PER_MESSAGE):
+            set_deadline(conn, deadline)
+            socket.send_fds(conn, [b"F"], fds[i:i + MAX_FDS_PER_MESSAGE])
+
+        set_deadline(conn, deadline)
+        if recv_exact(conn, 2) != b"OK":
+            raise ConnectionError("Handoff not acknowledged")
+        # Commit: the new process starts serving only after this, and we never serve again
+        conn.sendall(b"GO")
+    except Exception as e:
+        # New process failed or stalled, resume serving everyone here
+        # It never got GO, so it drops its copies of the sockets when it sees us close
+        print(f"Handoff failed: {e}")
+        os.read(wake_r, 1)
+        handoff_requested.clear()
+        handoff_finished.set()
+        return
+
+    # The new process owns every socket now, leave without closing them
+    print(f"Handed off {len(fds) - 1} connections, exiting")
+    sys.stdout.flush()
+    os._exit(0)
+
+
+def handoff_listener():
+    # Wait for a new server process to ask for the sockets
+    path = HANDOFF_PATH.format(port=PORT)
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+    ls = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    ls.bind(path)
+    os.chmod(path, 0o600)
+    ls.listen(1)
+    while True:
+        conn, _ = ls.accept()
+        # Only park the room for a peer that really is a new server
+        if trusted_peer(conn):
+            hand_off(conn)
+        conn.close()
+
+
+def trusted_peer(conn):
+    # Accept a handoff only from the same user speaking the same version
+    if hasattr(socket, "SO_PEERCRED"):
+        creds = conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+        _, uid, _ = struct.unpack("3i", creds)
+        if uid != os.getuid():
+            return False
+    try:
+        conn.settimeout(HANDOFF_HELLO_TIMEOUT)
+        if recv_exact(conn, len(HANDOFF_HELLO)) != HANDOFF_HELLO:
+            return False
+        conn.sendall(HANDOFF_HELLO)
+    except OSError:
+        return False
+    return True
+
+
+def take_over():
+    # Inherit the listening socket, clients and room state from a running server
+    global server_start_time, admin_username, connection_order
+
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # The old process may spend its drain, flush and exchange timeouts before answering
+    conn.settimeout(HANDOFF_HELLO_TIMEOUT + HANDOFF_DRAIN_TIMEOUT + SENDER_FLUSH_TIMEOUT + HANDOFF_EXCHANGE_TIMEOUT)
+    conn.connect(HANDOFF_PATH.format(port=PORT))
+    conn.sendall(HANDOFF_HELLO)
+    if recv_exact(conn, len(HANDOFF_HELLO)) != HANDOFF_HELLO:
+        raise ConnectionError("Running server speaks a different handoff version")
+    size = struct.unpack("!I", recv_exact(conn, 4))[0]
+    state = json.loads(recv_exact(conn, size))
+
+    fds = []
+    while len(fds) < state["fds"]:
+        _, received, _, _ = socket.recv_fds(conn, 1, MAX_FDS_PER_MESSAGE)
+        if not received: raise ConnectionError("Handoff peer closed")
+        fds.extend(received)
+
+    # Not ours until the old process confirms; if it gave up it keeps serving these sockets
+    conn.sendall(b"OK")
+    try:
+        confirmed = recv_exact(conn, 2) == b"GO"
+    except OSError:
+        confirmed = False
+    conn.close()
+    if not confirmed:
+        # Close only our copies, the old process still serves the clients
+        for fd in fds:
+            os.close(fd)
+        raise ConnectionError("Running server did not confirm the handoff")
+
+    s = socket.socket(fileno=fds[0])
+    server_start_time = state["server_start_time"]
+    admin_username = state["admin_username"]
+    for u in state["muted_users"]:
+        muted_users[u] = None
+
+    inherited = []
+    for fd, (username, buffer) in zip(fds[1:], state["clients"]):
+        inherited.append((socket.socket(fileno=fd), username, buffer))
+
+    # Keep the join order so /users looks the same as before the reload
+    by_name = {username: sock for sock, username, _ in inherited if username}
+    for u in state["connection_order"]:
+        clients[u] = by_name[u]
+        attach(by_name[u], u)
+    connection_order = list(state["connection_order"])
+
+    # Only start serving once the whole room is restored
+    for sock, username, buffer in inherited:
+        threading.Thread(target=handle_client, args=(sock, username, buffer), daemon=True).start()
+
+    # The admin may have been dropped if it could not be handed over
+    if admin_username not in clients:
+        promote_new_admin()
+
+    print(f"Took over {len(inherited)} connections")
+    return s
+
+
+def admit(sock):
+    # Start serving a new connection, or turn it away if we are over capacity
+    with lock:
+        busy = len(active) >= MAX_CONNECTIONS or len(handshaking) >= MAX_HANDSHAKES
+        if not busy:
+            active.add(sock)
+            handshaking.add(sock)
+
+    if not busy:
+        try:
+            threading.Thread(target=handle_client, args=(sock,), daemon=True).start()
+            return
+        except RuntimeError:
+            # The system refused another thread, treat it as being full
+            with lock:
+                active.discard(sock)
+                handshaking.discard(sock)
+
+    safe_send(sock, BUSY_REPLY)
+    try:
+        sock.close()
+    except:
+        pass
+
+
+def raise_fd_limit():
+    # Each client needs a descriptor, lift the soft limit so MAX_CONNECTIONS is reachable
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        wanted = MAX_CONNECTIONS + MAX_HANDSHAKES + 64
+        if soft != resource.RLIM_INFINITY and soft < wanted:
+            if hard != resource.RLIM_INFINITY:
+                wanted = min(wanted, hard)
+            resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+    except (ImportError, ValueError, OSError):
+        # Not available on this platform, accepts back off on EMFILE instead
+        pass
+
+
+def start_server(takeover=False):
+    global listener
+
+    raise_fd_limit()
+    start_senders()
+    if takeover:
+        s = take_over()
+    else:
+        # Initialize server socket
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        # Allow immediate port reuse after stop
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        s.bind((HOST, PORT))
+        # A large backlog absorbs reconnect storms while we catch up
+        s.listen(LISTEN_BACKLOG)
+    listener = s
     print(f"Server started on {HOST}:{PORT}")
-    # Accept incoming connections
+
+    if RELOAD_SUPPORTED:
+        threading.Thread(target=handoff_listener, daemon=True).start()
+
+    # Accept incoming connections in batches on each wakeup
+    s.setblocking(False)
+    poller = make_poller(s)
     while True:
-        c, _ = s.accept()
-        threading.Thread(target=handle_client, args=(c,), daemon=True).start()
+        if handoff_requested.is_set():
+            # Leave new connections in the backlog for the next process
+            accept_paused.set()
+            handoff_finished.wait()
+            continue
+        if poller is None:
+            select.select([s], [], [])
+        elif any(fd == wake_r for fd, _ in poller.poll()):
+            continue
+        for _ in range(ACCEPT_BATCH):
+            try:
+                c, _ = s.accept()
+            except BlockingIOError:
+                break
+            except OSError as e:
+                if e.errno in ACCEPT_BACKOFF_ERRORS:
+                    # Out of descriptors or memory, back off and let clients leave
+                    time.sleep(0.1)
+                    break
+                # The client gave up before we got to it, move on to the next one
+                continue
+            c.setblocking(True)
+            admit(c)
 
 
 if __name__ == "__main__":
-    start_server()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Chat server")
+    parser.add_argument("--takeover", action="store_true",
+                        help="replace the server running on this port without downtime")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--senders", type=int, default=SENDER_PROCESSES,
+                        help="sender processes for fan-out, 0 sends from the client threads")
+    parser.add_argument("--max-connections", type=int, default=MAX_CONNECTIONS,
+                        help="clients served at once before new ones get BUSY")
+    parser.add_argument("--max-handshakes", type=int, default=MAX_HANDSHAKES,
+                        help="connections allowed to be choosing a username at once")
+    args = parser.parse_args()
+    PORT = args.port
+    SENDER_PROCESSES = args.senders
+    MAX_CONNECTIONS = args.max_connections
+    MAX_HANDSHAKES = args.max_handshakes
+    start_server(args.takeover)